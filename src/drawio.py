@@ -1,13 +1,23 @@
+import io
 import os
 import xml.etree.ElementTree as ET
 
 from dataclasses import dataclass
 from enum import auto, Enum
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, TextIO
+from xml.sax.saxutils import escape
 
 ACTIVATION_WIDTH = 10
 MESSAGE_ANCHOR_DY = 5
 
+# same escaping as ElementTree uses for attribute values ('&', '<' and '>' are handled by escape itself)
+ATTRIBUTE_ENTITIES = {
+    '"': '&quot;',
+    '\n': '&#10;',
+    '\r': '&#13;',
+    '\t': '&#09;',
+}
+
 StyleAttributes = Dict[str, Optional[str]]
 
 
@@ -28,24 +38,13 @@ class File:
         return root
 
     def xml_pretty(self) -> str:
-        # manually pretty print output to stay compatible with Python 3.8
-        xml_str = ET.tostring(self.xml(), encoding='utf-8', xml_declaration=False).decode('utf-8')
-        output = ''
-        indent = 0
-
-        for line in xml_str.replace('>', '>\n').split('\n'):
-            if not line:
-                continue
-
-            if line.startswith('</'):
-                indent -= 2
-
-            output += (' ' * indent) + line + '\n'
-
-            if not line.startswith('</') and not line.endswith('/>'):
-                indent += 2
+        output = io.StringIO()
+        self.write_pretty(output)
+        return output.getvalue()
 
-        return output
+    def write_pretty(self, stream: TextIO):
+        # manually pretty print output to stay compatible with Python 3.8
+        write_element_pretty(stream, self.xml(), 0)
 
 
 class Page:
@@ -576,6 +575,21 @@ class TextAlignment(Enum):
         return style_map[self]
 
 
+def write_element_pretty(stream: TextIO, element: ET.Element, indent: int):
+    prefix = ' ' * indent
+    attributes = ''.join(f' {key}="{escape(value, ATTRIBUTE_ENTITIES)}"' for key, value in element.attrib.items())
+
+    if len(element):
+        stream.write(f'{prefix}<{element.tag}{attributes}>\n')
+
+        for child in element:
+            write_element_pretty(stream, child, indent + 2)
+
+        stream.write(f'{prefix}</{element.tag}>\n')
+    else:
+        stream.write(f'{prefix}<{element.tag}{attributes} />\n')
+
+
 # Live reloading in draw.io does not work well if an object ID is suddenly used for another type of object.
 # On the other side, the integration test require a predictable output.
 # Using deterministic IDs with a random prefix which can be overridden for testing seems like a good trade-off.
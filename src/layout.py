@@ -1,4 +1,5 @@
-from typing import List, Optional, Iterable
+import math
+from typing import List, Optional, Dict, Callable, Any, Iterator, Union
 
 import seqast
 import drawio
@@ -38,32 +39,84 @@ MESSAGE_ANCHOR_DY = drawio.MESSAGE_ANCHOR_DY
 
 
 class PositionMarker:
+    __slots__ = ('y',)
+
     def __init__(self):
         self.y = START_POSITION_Y - STATEMENT_OFFSET_Y
 
 
 class ParticipantInfo:
+    __slots__ = ('index', 'name', 'lifeline', 'center_x', 'activation_stack', 'endpoint',
+                 'center_marker', 'left_marker', 'right_marker')
+
     def __init__(self, index: int, name: str, lifeline: drawio.Lifeline):
         self.index = index
         self.name = name
         self.lifeline = lifeline
+        # lifeline geometry is fixed once the participant is declared
+        self.center_x: float = lifeline.center_x()
         self.activation_stack: List[drawio.Activation] = []
+        # object messages are connected to: the top most activation, or the lifeline if inactive
+        self.endpoint: drawio.Object = lifeline
         self.center_marker: PositionMarker = PositionMarker()
         self.left_marker: PositionMarker = PositionMarker()
         self.right_marker: PositionMarker = PositionMarker()
 
 
 class FrameDimension:
+    __slots__ = ('min_x', 'max_x')
+
     def __init__(self):
-        self.min_x: Optional[float] = None
-        self.max_x: Optional[float] = None
+        # empty until the first update, infinities avoid special casing the first update
+        self.min_x: float = math.inf
+        self.max_x: float = -math.inf
+
+    def is_empty(self) -> bool:
+        return self.min_x > self.max_x
+
+
+def activation_dx_inactive(participant: ParticipantInfo, activator_x: Optional[float]) -> float:
+    # if participant is not active we always start in the middle
+    return 0
+
+
+def activation_dx_active_once(participant: ParticipantInfo, activator_x: Optional[float]) -> float:
+    # if participant is activated once, we consider the location of the activator
+    if activator_x is None or activator_x > participant.center_x:
+        return ACTIVATION_STACK_OFFSET_X
+    else:
+        return -ACTIVATION_STACK_OFFSET_X
+
+
+def activation_dx_active_multiple(participant: ParticipantInfo, activator_x: Optional[float]) -> float:
+    # if participant is activated multiple times, we keep stacking into the same direction
+    top, below = participant.activation_stack[-1], participant.activation_stack[-2]
+
+    if top.dx > below.dx:
+        return top.dx + ACTIVATION_STACK_OFFSET_X
+    else:
+        return top.dx - ACTIVATION_STACK_OFFSET_X
+
+
+# indexed by the number of activations on the stack, capped at two
+ACTIVATION_DX_BY_STACK_DEPTH = (
+    activation_dx_inactive,
+    activation_dx_active_once,
+    activation_dx_active_multiple,
+)
 
 
 class Layouter:
     def __init__(self, page: drawio.Page):
         self.page = page
         self.participants: List[ParticipantInfo] = []
+        self.participants_by_name: Dict[str, ParticipantInfo] = {}
+        self.position_markers: List[PositionMarker] = []
+        # vertical offsets shift all markers at once, marker positions are stored relative to this offset
+        self.position_marker_offset: float = 0
         self.frame_dimension_stack: List[FrameDimension] = [FrameDimension()]
+        # top of the frame dimension stack, updated whenever the stack changes
+        self.frame_dimension_current: FrameDimension = self.frame_dimension_stack[-1]
         self.title_frame: Optional[drawio.Frame] = None
         self.current_position_y = START_POSITION_Y
         self.executed = False
@@ -87,36 +140,52 @@ class Layouter:
     def finalize_title_frame(self):
         assert len(self.frame_dimension_stack) == 1
         dimensions = self.frame_dimension_stack.pop()
+        title_frame = self.title_frame
 
-        if not self.title_frame:
+        if not title_frame:
             return
 
-        self.title_frame.x = dimensions.min_x - TITLE_FRAME_PADDING
-        self.title_frame.y = -TITLE_FRAME_PADDING - self.title_frame.box_height
-        self.title_frame.width = dimensions.max_x + TITLE_FRAME_PADDING - self.title_frame.x
-        self.title_frame.height = (self.current_position_y - self.title_frame.y) + TITLE_FRAME_PADDING
+        assert not dimensions.is_empty(), "title frame has no content"
+
+        title_frame.x = dimensions.min_x - TITLE_FRAME_PADDING
+        title_frame.y = -TITLE_FRAME_PADDING - title_frame.box_height
+        title_frame.width = dimensions.max_x + TITLE_FRAME_PADDING - title_frame.x
+        title_frame.height = (self.current_position_y - title_frame.y) + TITLE_FRAME_PADDING
 
     def process_statements(self, statements: List[seqast.Statement]):
-        handlers = {
-            seqast.TitleStatement: self.handle_title,
-            seqast.ParticipantStatement: self.handle_participant,
-            seqast.ActivateStatement: self.handle_activate,
-            seqast.DeactivateStatement: self.handle_deactivate,
-            seqast.FoundMessageStatement: self.handle_found_message,
-            seqast.LostMessageStatement: self.handle_lost_message,
-            seqast.MessageStatement: self.handle_message,
-            seqast.FrameStatement: self.handle_frame,
-            seqast.NoteStatement: self.handle_note,
-            seqast.VerticalOffsetStatement: self.handle_vertical_offset,
-            seqast.ExtendFrameStatement: self.handle_extend_frame,
-        }
-
-        for statement in statements:
-            try:
+        handlers = self.STATEMENT_HANDLERS
+
+        # Handlers of nested statements (frames) return an iterator over their inner statements instead of
+        # recursing. The iterators are processed using an explicit stack, each with the frame statement it belongs
+        # to. Advancing a frame's iterator opens, divides and closes the frame, so its errors name the frame.
+        iterators: List[Iterator[seqast.Statement]] = [iter(statements)]
+        frames: List[seqast.Statement] = []
+        statement: seqast.Statement
+
+        try:
+            while True:
+                if frames:
+                    statement = frames[-1]
+
+                next_statement = next(iterators[-1], None)
+
+                if next_statement is None:
+                    if not frames:
+                        break
+
+                    iterators.pop()
+                    frames.pop()
+                    continue
+
+                statement = next_statement
                 # noinspection PyTypeChecker, PyArgumentList
-                handlers[type(statement)](statement)
-            except:
-                raise RuntimeError(f'error processing statement on line {statement.line_number}')
+                inner = handlers[type(statement)](self, statement)
+
+                if inner is not None:
+                    iterators.append(inner)
+                    frames.append(statement)
+        except Exception as e:
+            raise RuntimeError(f'error processing statement on line {statement.line_number}') from e
 
     def handle_title(self, statement: seqast.TitleStatement):
         assert not self.title_frame, "title may occur only once"
@@ -142,15 +211,26 @@ class Layouter:
 
         if not first_participant:
             participant.left_marker = self.participants[-1].right_marker
+            new_markers = [participant.center_marker, participant.right_marker]
+        else:
+            new_markers = [participant.left_marker, participant.center_marker, participant.right_marker]
+
+        # new markers are not affected by preceding vertical offsets
+        for marker in new_markers:
+            marker.y -= self.position_marker_offset
+
+        # markers are ordered from left to right: [p0.left, p0.center, p0.right, p1.center, p1.right, ...]
+        self.position_markers.extend(new_markers)
 
         self.participants.append(participant)
-        self.frame_dimension(lifeline.x, lifeline.x + lifeline.width)
+        self.participants_by_name[statement.name] = participant
+        self.frame_dimension_between(lifeline.x, lifeline.x + lifeline.width)
 
     def handle_activate(self, statement: seqast.ActivateStatement):
         for name in statement.targets:
             participant = self.participant_by_name(name)
             self.participant_activate(participant)
-            self.frame_dimension(participant.lifeline.center_x(), extra_padding=True)
+            self.frame_dimension(participant.center_x, extra_padding=True)
 
         self.current_position_y += STATEMENT_OFFSET_Y
 
@@ -160,7 +240,7 @@ class Layouter:
             assert participant.activation_stack, "participant not activated"
             self.participant_deactivate(participant)
             self.position_marker_update(participant.center_marker)
-            self.frame_dimension(participant.lifeline.center_x(), extra_padding=True)
+            self.frame_dimension(participant.center_x, extra_padding=True)
 
         self.current_position_y += STATEMENT_OFFSET_Y
 
@@ -169,15 +249,16 @@ class Layouter:
             f"{statement.activation} not supported for found message"
 
         receiver = self.participant_by_name(statement.receiver)
+        receiver_x = receiver.center_x
         width = statement.width or FOUND_LOST_MESSAGE_DEFAULT_WIDTH
 
-        if statement.from_direction == seqast.MessageDirection.LEFT:
-            source_x = receiver.lifeline.center_x() - width
+        if statement.from_direction is seqast.MessageDirection.LEFT:
+            source_x = receiver_x - width
             marker = receiver.left_marker
             target_anchor = drawio.TargetAnchor.ACTIVATION_TOP_LEFT
             source_anchor = drawio.SourceAnchor.FOUND_DOT_RIGHT
-        elif statement.from_direction == seqast.MessageDirection.RIGHT:
-            source_x = receiver.lifeline.center_x() + width
+        elif statement.from_direction is seqast.MessageDirection.RIGHT:
+            source_x = receiver_x + width
             marker = receiver.right_marker
             target_anchor = drawio.TargetAnchor.ACTIVATION_TOP_RIGHT
             source_anchor = drawio.SourceAnchor.FOUND_DOT_LEFT
@@ -185,7 +266,7 @@ class Layouter:
             raise NotImplementedError()
 
         # activation before message
-        if statement.activation == seqast.MessageActivation.ACTIVATE:
+        if statement.activation is seqast.MessageActivation.ACTIVATE:
             self.position_marker_ensure_spacing(marker, MESSAGE_MIN_SPACING - MESSAGE_ANCHOR_DY)
             self.participant_activate(receiver, source_x)
             self.current_position_y += MESSAGE_ANCHOR_DY
@@ -193,38 +274,35 @@ class Layouter:
             self.position_marker_ensure_spacing(marker, MESSAGE_MIN_SPACING)
 
         # actual message
-        bullet = drawio.LostFoundDot(self.page)
-        bullet.set_position(source_x, self.current_position_y)
-        target = receiver.activation_stack[-1] if receiver.activation_stack else receiver.lifeline
-        message = drawio.Message(bullet, target, statement.text)
-        message.points.append(drawio.Point((source_x + receiver.lifeline.center_x()) / 2, self.current_position_y))
-        message.line_style = statement.line_style
-        message.arrow_style = statement.arrow_style
+        bullet = self.lost_found_dot_create(source_x)
+        message = self.message_create(bullet, receiver.endpoint, statement)
+        message.points.append(drawio.Point((source_x + receiver_x) / 2, self.current_position_y))
         message.source_anchor = source_anchor
 
-        if statement.activation == seqast.MessageActivation.ACTIVATE:
+        if statement.activation is seqast.MessageActivation.ACTIVATE:
             message.target_anchor = target_anchor
 
         self.position_marker_update(marker)
 
         # layout
         self.current_position_y += STATEMENT_OFFSET_Y
-        self.frame_dimension(source_x, receiver.lifeline.center_x(), extra_padding=True)
+        self.frame_dimension_between(source_x, receiver_x, extra_padding=True)
 
     def handle_lost_message(self, statement: seqast.LostMessageStatement):
         assert statement.activation in (seqast.MessageActivation.REGULAR, seqast.MessageActivation.DEACTIVATE), \
             f"{statement.activation} not supported for found message"
 
         sender = self.participant_by_name(statement.sender)
+        sender_x = sender.center_x
         width = statement.width or FOUND_LOST_MESSAGE_DEFAULT_WIDTH
 
-        if statement.to_direction == seqast.MessageDirection.LEFT:
-            source_x = sender.lifeline.center_x() - width
+        if statement.to_direction is seqast.MessageDirection.LEFT:
+            source_x = sender_x - width
             marker = sender.left_marker
             source_anchor = drawio.SourceAnchor.ACTIVATION_BOTTOM_LEFT
             target_anchor = drawio.TargetAnchor.LOST_DOT_RIGHT
-        elif statement.to_direction == seqast.MessageDirection.RIGHT:
-            source_x = sender.lifeline.center_x() + width
+        elif statement.to_direction is seqast.MessageDirection.RIGHT:
+            source_x = sender_x + width
             marker = sender.right_marker
             source_anchor = drawio.SourceAnchor.ACTIVATION_BOTTOM_RIGHT
             target_anchor = drawio.TargetAnchor.LOST_DOT_LEFT
@@ -234,21 +312,17 @@ class Layouter:
         self.position_marker_ensure_spacing(marker, MESSAGE_MIN_SPACING)
 
         # actual message
-        bullet = drawio.LostFoundDot(self.page)
-        bullet.set_position(source_x, self.current_position_y)
-        source = sender.activation_stack[-1] if sender.activation_stack else sender.lifeline
-        message = drawio.Message(source, bullet, statement.text)
-        message.line_style = statement.line_style
-        message.arrow_style = statement.arrow_style
+        bullet = self.lost_found_dot_create(source_x)
+        message = self.message_create(sender.endpoint, bullet, statement)
         message.target_anchor = target_anchor
 
-        if statement.activation == seqast.MessageActivation.DEACTIVATE:
+        if statement.activation is seqast.MessageActivation.DEACTIVATE:
             message.source_anchor = source_anchor
 
         self.position_marker_update(marker)
 
         # deactivation after message
-        if statement.activation == seqast.MessageActivation.DEACTIVATE:
+        if statement.activation is seqast.MessageActivation.DEACTIVATE:
             assert sender.activation_stack, "sender not activated"
             self.current_position_y += MESSAGE_ANCHOR_DY
             self.participant_deactivate(sender)
@@ -256,7 +330,7 @@ class Layouter:
 
         # layout
         self.current_position_y += STATEMENT_OFFSET_Y
-        self.frame_dimension(source_x, sender.lifeline.center_x(), extra_padding=True)
+        self.frame_dimension_between(source_x, sender_x, extra_padding=True)
 
     def handle_message(self, statement: seqast.MessageStatement):
         if statement.sender == statement.receiver:
@@ -265,57 +339,55 @@ class Layouter:
 
         sender = self.participant_by_name(statement.sender)
         receiver = self.participant_by_name(statement.receiver)
+        sender_x = sender.center_x
+        receiver_x = receiver.center_x
         min_spacing = MESSAGE_MIN_SPACING
 
         # activation before message
-        if statement.activation == seqast.MessageActivation.ACTIVATE:
+        if statement.activation is seqast.MessageActivation.ACTIVATE:
             min_spacing -= MESSAGE_ANCHOR_DY
-        if statement.activation == seqast.MessageActivation.FIREFORGET:
+        if statement.activation is seqast.MessageActivation.FIREFORGET:
             min_spacing -= FIREFORGET_ACTIVATION_HEIGHT / 2
 
-        self.position_marker_ensure_spacing_between(sender, receiver, min_spacing)
+        markers = self.position_marker_between(sender, receiver)
+        self.position_marker_ensure_spacing_list(markers, min_spacing)
 
-        if statement.activation == seqast.MessageActivation.ACTIVATE:
-            self.participant_activate(receiver, sender.lifeline.center_x())
+        if statement.activation is seqast.MessageActivation.ACTIVATE:
+            self.participant_activate(receiver, sender_x)
             self.current_position_y += MESSAGE_ANCHOR_DY
-        if statement.activation == seqast.MessageActivation.FIREFORGET:
-            self.participant_activate(receiver, sender.lifeline.center_x())
+        if statement.activation is seqast.MessageActivation.FIREFORGET:
+            self.participant_activate(receiver, sender_x)
             self.current_position_y += FIREFORGET_ACTIVATION_HEIGHT / 2
 
         # actual message
-        source = sender.activation_stack[-1] if sender.activation_stack else sender.lifeline
-        target = receiver.activation_stack[-1] if receiver.activation_stack else receiver.lifeline
+        message = self.message_create(sender.endpoint, receiver.endpoint, statement)
 
-        message = drawio.Message(source, target, statement.text)
-        message.line_style = statement.line_style
-        message.arrow_style = statement.arrow_style
-
-        if statement.activation == seqast.MessageActivation.ACTIVATE:
+        if statement.activation is seqast.MessageActivation.ACTIVATE:
             message.target_anchor = drawio.TargetAnchor.ACTIVATION_TOP_LEFT if sender.index < receiver.index else drawio.TargetAnchor.ACTIVATION_TOP_RIGHT
-        elif statement.activation == seqast.MessageActivation.DEACTIVATE:
+        elif statement.activation is seqast.MessageActivation.DEACTIVATE:
             message.source_anchor = drawio.SourceAnchor.ACTIVATION_BOTTOM_RIGHT if sender.index < receiver.index else drawio.SourceAnchor.ACTIVATION_BOTTOM_LEFT
         else:
             message.points.append(drawio.Point(
-                x=(sender.lifeline.center_x() + receiver.lifeline.center_x()) / 2,
+                x=(sender_x + receiver_x) / 2,
                 y=self.current_position_y
             ))
 
-        self.position_marker_update_between(sender, receiver)
+        self.position_marker_update_list(markers)
 
         # deactivation after message
-        if statement.activation == seqast.MessageActivation.DEACTIVATE:
+        if statement.activation is seqast.MessageActivation.DEACTIVATE:
             assert sender.activation_stack, "sender not activated"
             self.current_position_y += MESSAGE_ANCHOR_DY
             self.participant_deactivate(sender)
             self.position_marker_update(sender.center_marker)
-        if statement.activation == seqast.MessageActivation.FIREFORGET:
+        if statement.activation is seqast.MessageActivation.FIREFORGET:
             self.current_position_y += FIREFORGET_ACTIVATION_HEIGHT / 2
             self.participant_deactivate(receiver)
             self.position_marker_update(receiver.center_marker)
 
         # layout
         self.current_position_y += STATEMENT_OFFSET_Y
-        self.frame_dimension(sender.lifeline.center_x(), receiver.lifeline.center_x(), extra_padding=True)
+        self.frame_dimension_between(sender_x, receiver_x, extra_padding=True)
 
     def handle_self_call(self, statement: seqast.MessageStatement):
         assert statement.sender == statement.receiver
@@ -325,17 +397,14 @@ class Layouter:
 
         participant = self.participant_by_name(statement.sender)
 
-        if participant.activation_stack:
-            from_activation = participant.activation_stack[-1]
-        else:
-            from_activation = participant.lifeline
+        from_activation = participant.endpoint
 
         self.current_position_y += STATEMENT_OFFSET_Y
 
         # activation for self call
         if statement.activation in (seqast.MessageActivation.ACTIVATE, seqast.MessageActivation.FIREFORGET):
             self.participant_activate(participant)
-            to_activation = participant.activation_stack[-1]
+            to_activation = participant.endpoint
         else:
             to_activation = from_activation
 
@@ -345,11 +414,9 @@ class Layouter:
             to_activation_dx = 0
 
         # create self call message
-        message = drawio.Message(from_activation, to_activation, statement.text)
-        message.line_style = statement.line_style
-        message.arrow_style = statement.arrow_style
+        message = self.message_create(from_activation, to_activation, statement)
 
-        activation_x = participant.lifeline.center_x() + to_activation_dx
+        activation_x = participant.center_x + to_activation_dx
 
         if to_activation_dx >= 0:
             self_call_x = activation_x + SELF_CALL_MESSAGE_DX
@@ -360,32 +427,34 @@ class Layouter:
             frame_x = self_call_x - SELF_CALL_MIN_TEXT_WIDTH
             message.text_alignment = drawio.TextAlignment.MIDDLE_RIGHT
 
+        center_y = self.current_position_y
+
         message.points.append(drawio.Point(
             x=self_call_x,
-            y=self.current_position_y - STATEMENT_OFFSET_Y,
+            y=center_y - STATEMENT_OFFSET_Y,
         ))
 
         message.points.append(drawio.Point(
             x=self_call_x,
-            y=self.current_position_y + STATEMENT_OFFSET_Y
+            y=center_y + STATEMENT_OFFSET_Y
         ))
 
-        self.current_position_y += 2 * STATEMENT_OFFSET_Y
+        self.current_position_y = center_y + 2 * STATEMENT_OFFSET_Y
 
         # deactivate after self call
-        if statement.activation == seqast.MessageActivation.FIREFORGET:
+        if statement.activation is seqast.MessageActivation.FIREFORGET:
             self.participant_deactivate(participant)
             self.current_position_y += STATEMENT_OFFSET_Y
 
-        self.frame_dimension(participant.lifeline.center_x(), frame_x, extra_padding=True)
+        self.frame_dimension_between(participant.center_x, frame_x, extra_padding=True)
 
-    def handle_frame(self, statement: seqast.FrameStatement):
+    def handle_frame(self, statement: seqast.FrameStatement) -> Iterator[seqast.Statement]:
         frame = self.frame_open(statement.title, statement.text)
-        self.process_statements(statement.inner)
+        yield from statement.inner
 
         for section in statement.sections:
             self.frame_section(frame, section.text)
-            self.process_statements(section.inner)
+            yield from section.inner
 
         self.frame_close(frame)
 
@@ -393,26 +462,37 @@ class Layouter:
         participant = self.participant_by_name(statement.target)
 
         note = drawio.Note(self.page, statement.text)
-        note.x = participant.lifeline.center_x() + (statement.dx or 0)
+        note.x = participant.center_x + (statement.dx or 0)
         note.y = self.current_position_y + (statement.dy or 0)
         note.width = statement.width or NOTE_DEFAULT_WIDTH
         note.height = statement.height or NOTE_DEFAULT_HEIGHT
 
     def handle_vertical_offset(self, statement: seqast.VerticalOffsetStatement):
         self.current_position_y += statement.offset
-
-        for marker in self.position_marker_all():
-            marker.y += statement.offset
+        self.position_marker_offset += statement.offset
 
     def handle_extend_frame(self, statement: seqast.ExtendFrameStatement):
-        dimensions = self.frame_dimension_stack[-1]
-        assert dimensions.min_x is not None and dimensions.max_x is not None, "cannot extend empty frame"
+        dimensions = self.frame_dimension_current
+        assert not dimensions.is_empty(), "cannot extend empty frame"
 
         if statement.extend >= 0:
             dimensions.max_x += statement.extend
         else:
             dimensions.min_x += statement.extend
 
+    def message_create(self, source: drawio.Object, target: drawio.Object,
+                       statement: Union[seqast.MessageStatement, seqast.FoundMessageStatement,
+                                        seqast.LostMessageStatement]) -> drawio.Message:
+        message = drawio.Message(source, target, statement.text)
+        message.line_style = statement.line_style
+        message.arrow_style = statement.arrow_style
+        return message
+
+    def lost_found_dot_create(self, center_x: float) -> drawio.LostFoundDot:
+        dot = drawio.LostFoundDot(self.page)
+        dot.set_position(center_x, self.current_position_y)
+        return dot
+
     def frame_open(self, title: str, text: Optional[str] = None) -> drawio.Frame:
         # create frame
         self.current_position_y += CONTROL_FRAME_SPACING_BEFORE
@@ -425,19 +505,16 @@ class Layouter:
         # push frame stack
         dimension = FrameDimension()
         self.frame_dimension_stack.append(dimension)
+        self.frame_dimension_current = dimension
 
         # handle text
         if text:
-            text = drawio.Text(self.page, frame, f'[{text}]')
-            text.alignment = drawio.TextAlignment.TOP_LEFT
-            text.x = 10
-            text.y = CONTROL_FRAME_BOX_HEIGHT + 5
-
+            self.frame_label(frame, text, CONTROL_FRAME_BOX_HEIGHT)
             self.current_position_y += CONTROL_FRAME_BOX_HEIGHT + CONTROL_FRAME_LABEL_HEIGHT
         else:
             self.current_position_y += CONTROL_FRAME_BOX_HEIGHT + STATEMENT_OFFSET_Y
 
-        self.position_marker_update_all(-STATEMENT_OFFSET_Y)
+        self.position_marker_update_list(self.position_markers, -STATEMENT_OFFSET_Y)
 
         return frame
 
@@ -447,19 +524,20 @@ class Layouter:
 
         # positioning on frame end
         self.current_position_y += STATEMENT_OFFSET_Y
-        self.position_marker_update_all()
+        self.position_marker_update_list(self.position_markers)
         self.current_position_y += CONTROL_FRAME_SPACING_AFTER
 
         # pop frame stack
         dimension = self.frame_dimension_stack.pop()
+        self.frame_dimension_current = self.frame_dimension_stack[-1]
 
         # set frame width
-        assert dimension.min_x is not None and dimension.max_x is not None, "unknown frame dimension"
+        assert not dimension.is_empty(), "unknown frame dimension"
         frame.x = dimension.min_x - CONTROL_FRAME_PADDING
         frame.width = dimension.max_x + CONTROL_FRAME_PADDING - frame.x
 
         # update dimension for parent frame
-        self.frame_dimension(frame.x, frame.x + frame.width)
+        self.frame_dimension_between(frame.x, frame.x + frame.width)
 
     def frame_section(self, frame: drawio.Frame, text: Optional[str] = None):
         # create separator
@@ -468,104 +546,98 @@ class Layouter:
 
         # handle text
         if text:
-            text = drawio.Text(self.page, frame, f'[{text}]')
-            text.alignment = drawio.TextAlignment.TOP_LEFT
-            text.x = 10
-            text.y = separator.y + 5
-
+            self.frame_label(frame, text, separator.y)
             self.current_position_y += CONTROL_FRAME_LABEL_HEIGHT
         else:
             self.current_position_y += STATEMENT_OFFSET_Y
 
-        self.position_marker_update_all(-STATEMENT_OFFSET_Y)
+        self.position_marker_update_list(self.position_markers, -STATEMENT_OFFSET_Y)
+
+    def frame_label(self, frame: drawio.Frame, text: str, y: float):
+        label = drawio.Text(self.page, frame, f'[{text}]')
+        label.alignment = drawio.TextAlignment.TOP_LEFT
+        label.x = 10
+        label.y = y + 5
 
-    def frame_dimension(self, *x: float, extra_padding: bool = False):
-        dimension = self.frame_dimension_stack[-1]
+    def frame_dimension(self, x: float, extra_padding: bool = False):
+        dimension = self.frame_dimension_current
         extra_padding_val = CONTROL_FRAME_ACTIVITY_EXTRA_PADDING if extra_padding else 0
 
-        if dimension.min_x is None:
-            dimension.min_x = min(x) - extra_padding_val
-        else:
-            dimension.min_x = min(dimension.min_x, min(x) - extra_padding_val)
+        if x - extra_padding_val < dimension.min_x:
+            dimension.min_x = x - extra_padding_val
+        if x + extra_padding_val > dimension.max_x:
+            dimension.max_x = x + extra_padding_val
 
-        if dimension.max_x is None:
-            dimension.max_x = max(x) + extra_padding_val
-        else:
-            dimension.max_x = max(dimension.max_x, max(x) + extra_padding_val)
+    def frame_dimension_between(self, x1: float, x2: float, extra_padding: bool = False):
+        dimension = self.frame_dimension_current
+        extra_padding_val = CONTROL_FRAME_ACTIVITY_EXTRA_PADDING if extra_padding else 0
+
+        if x1 > x2:
+            x1, x2 = x2, x1
+
+        if x1 - extra_padding_val < dimension.min_x:
+            dimension.min_x = x1 - extra_padding_val
+        if x2 + extra_padding_val > dimension.max_x:
+            dimension.max_x = x2 + extra_padding_val
 
     def participant_activate(self, participant: ParticipantInfo, activator_x: Optional[float] = None):
         activation = drawio.Activation(participant.lifeline)
         activation.y = self.current_position_y
 
-        if not participant.activation_stack:
-            # if participant is not active we always start in the middle
-            activation.dx = 0
-
-        elif len(participant.activation_stack) == 1:
-            # if participant is activated once, we consider the location of the activator
-            if activator_x is None or activator_x > participant.lifeline.center_x():
-                next_dx = ACTIVATION_STACK_OFFSET_X
-            else:
-                next_dx = -ACTIVATION_STACK_OFFSET_X
-
-            activation.dx = next_dx
-
-        else:
-            # if participant is activated multiple times, we keep stacking into the same direction
-            if participant.activation_stack[-1].dx > participant.activation_stack[-2].dx:
-                next_dx = ACTIVATION_STACK_OFFSET_X
-            else:
-                next_dx = -ACTIVATION_STACK_OFFSET_X
-
-            activation.dx = participant.activation_stack[-1].dx + next_dx
+        stack_depth = min(len(participant.activation_stack), 2)
+        activation.dx = ACTIVATION_DX_BY_STACK_DEPTH[stack_depth](participant, activator_x)
 
         participant.activation_stack.append(activation)
+        participant.endpoint = activation
 
     def participant_deactivate(self, participant: ParticipantInfo):
         activation = participant.activation_stack.pop()
+        participant.endpoint = participant.activation_stack[-1] if participant.activation_stack else participant.lifeline
         activation.height = self.current_position_y - activation.y
 
     def participant_by_name(self, name: str) -> ParticipantInfo:
-        return next((p for p in self.participants if p.name == name), None)
+        return self.participants_by_name.get(name)
+
+    def position_marker_ensure_spacing_list(self, markers: List[PositionMarker], required_spacing: float):
+        # only the lowest marker matters
+        lowest_marker_y = max(marker.y for marker in markers)
+        required_position_y = lowest_marker_y + self.position_marker_offset + required_spacing
 
-    def position_marker_ensure_spacing_between(self, first: ParticipantInfo, second: ParticipantInfo,
-                                               required_spacing: float):
-        for marker in self.position_marker_between(first, second):
-            self.position_marker_ensure_spacing(marker, required_spacing)
+        if self.current_position_y < required_position_y:
+            self.current_position_y = required_position_y
 
     def position_marker_ensure_spacing(self, marker: PositionMarker, required_spacing: float):
-        current_spacing = (self.current_position_y - marker.y)
+        current_spacing = (self.current_position_y - (marker.y + self.position_marker_offset))
 
         if current_spacing < required_spacing:
             self.current_position_y += required_spacing - current_spacing
 
-    def position_marker_update_between(self, first: ParticipantInfo, second: ParticipantInfo):
-        for marker in self.position_marker_between(first, second):
-            self.position_marker_update(marker)
+    def position_marker_update_list(self, markers: List[PositionMarker], dy: float = 0):
+        y = self.current_position_y - self.position_marker_offset + dy
 
-    def position_marker_update_all(self, dy: float = 0):
-        for marker in self.position_marker_all():
-            self.position_marker_update(marker, dy)
+        for marker in markers:
+            marker.y = y
 
     def position_marker_update(self, marker: PositionMarker, dy: float = 0):
-        marker.y = self.current_position_y + dy
+        marker.y = self.current_position_y - self.position_marker_offset + dy
 
-    def position_marker_between(self, first: ParticipantInfo, second: ParticipantInfo) \
-            -> Iterable[PositionMarker]:
+    def position_marker_between(self, first: ParticipantInfo, second: ParticipantInfo) -> List[PositionMarker]:
+        # right marker of the left participant, center and right markers of all participants in between
         start_index = min(first.index, second.index)
         end_index = max(first.index, second.index)
-
-        for participant in self.participants[start_index:end_index + 1]:
-            if participant.index != start_index and participant.index != end_index:
-                yield participant.center_marker
-
-            if participant.index != end_index:
-                yield participant.right_marker
-
-    def position_marker_all(self) -> Iterable[PositionMarker]:
-        if self.participants:
-            yield self.participants[0].left_marker
-
-        for participant in self.participants:
-            yield participant.center_marker
-            yield participant.right_marker
+        return self.position_markers[2 * start_index + 2:2 * end_index + 1]
+
+    # handler for each statement type, a frame handler returns an iterator over the statements of the frame
+    STATEMENT_HANDLERS: Dict[type, Callable[['Layouter', Any], Optional[Iterator[seqast.Statement]]]] = {
+        seqast.TitleStatement: handle_title,
+        seqast.ParticipantStatement: handle_participant,
+        seqast.ActivateStatement: handle_activate,
+        seqast.DeactivateStatement: handle_deactivate,
+        seqast.FoundMessageStatement: handle_found_message,
+        seqast.LostMessageStatement: handle_lost_message,
+        seqast.MessageStatement: handle_message,
+        seqast.FrameStatement: handle_frame,
+        seqast.NoteStatement: handle_note,
+        seqast.VerticalOffsetStatement: handle_vertical_offset,
+        seqast.ExtendFrameStatement: handle_extend_frame,
+    }
@@ -3,11 +3,11 @@ import os
 
 import drawio
 
-import xml.etree.ElementTree as ET
-
 from seqast import Parser
 from layout import Layouter
 
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -27,8 +27,8 @@ def main():
     statement_list = Parser().parse(source)
     Layouter(page).layout(statement_list)
 
-    with open(output_path, 'w') as f:
-        f.write(file.xml_pretty())
+    with open(output_path, 'w', buffering=OUTPUT_BUFFER_SIZE) as f:
+        file.write_pretty(f)
 
 
 def change_ext(path, new_ext):
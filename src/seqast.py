@@ -1,7 +1,13 @@
+from __future__ import annotations
+
+import functools
+import os
+import sys
+
 from dataclasses import dataclass
 from enum import auto, Enum
 from typing import List, Optional, Any
-from lark import Lark, Transformer
+from lark import Lark, Transformer_NonRecursive, v_args
 from pathlib import Path
 
 from drawio import LineStyle, ArrowStyle
@@ -11,21 +17,64 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 
 class Parser:
     def __init__(self):
-        with open(SCRIPT_DIR / 'syntax.lark', 'r') as f:
-            grammar = f.read()
-
-        self.lark = Lark(grammar, start='start', propagate_positions=True)
+        self.lark = create_lark()
+        self.transformer = SeqTransformer()
 
-    def parse(self, text: str) -> List['Statement']:
-        text = text.replace('\r', '')
+    def parse(self, text: str) -> List[Statement]:
+        if '\r' in text:
+            text = text.replace('\r', '')
         if not text.endswith('\n'):
             text += '\n'
 
         parsed = self.lark.parse(text)
-        return SeqTransformer().transform(parsed)
+        return self.transformer.transform(parsed)
+
+
+# building the parser from the grammar is expensive, it is shared by all Parser instances
+# and Lark keeps the analysed grammar in a cache file between runs
+@functools.lru_cache(maxsize=1)
+def create_lark() -> Lark:
+    with open(SCRIPT_DIR / 'syntax.lark', 'r') as f:
+        grammar = f.read()
+
+    options = dict(start='start', parser='lalr', lexer='contextual', propagate_positions=True)
+    cache = lark_cache_path()
+
+    if cache:
+        # older Lark versions do not catch errors when writing the cache file
+        try:
+            return Lark(grammar, cache=cache, **options)
+        except OSError:
+            pass
+
+    return Lark(grammar, cache=False, **options)
+
 
+# the cache file is unpickled when loaded, so it is kept in a directory only the current user can write to
+def lark_cache_path() -> Optional[str]:
+    try:
+        # relative values must be ignored according to the XDG base directory specification
+        cache_home = Path(os.environ.get('XDG_CACHE_HOME', ''))
+        if not cache_home.is_absolute():
+            cache_home = Path.home() / '.cache'
 
-class SeqTransformer(Transformer):
+        cache_dir = cache_home / 'drawio-seqgen'
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        if hasattr(os, 'getuid'):
+            stat = cache_dir.stat()
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+                return None
+
+        if not os.access(cache_dir, os.W_OK):
+            return None
+    except (OSError, RuntimeError):
+        return None
+
+    return str(cache_dir / f'syntax-py{sys.version_info[0]}{sys.version_info[1]}.lark.cache')
+
+
+class SeqTransformer(Transformer_NonRecursive):
     @staticmethod
     def start(items):
         return consume_next(items, 'statement_list')
@@ -49,14 +98,14 @@ class SeqTransformer(Transformer):
         return TitleStatement(text, width, height)
 
     @staticmethod
-    def title_width(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'title_width')
+    @v_args(inline=True)
+    def title_width(value):
+        return ParsedValue(value.value, 'title_width')
 
     @staticmethod
-    def title_height(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'title_height')
+    @v_args(inline=True)
+    def title_height(value):
+        return ParsedValue(value.value, 'title_height')
 
     @staticmethod
     def participant(items):
@@ -72,14 +121,14 @@ class SeqTransformer(Transformer):
         return ParsedValue(value, 'participant_alias')
 
     @staticmethod
-    def participant_width(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'participant_width')
+    @v_args(inline=True)
+    def participant_width(value):
+        return ParsedValue(value.value, 'participant_width')
 
     @staticmethod
-    def participant_spacing(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'participant_spacing')
+    @v_args(inline=True)
+    def participant_spacing(value):
+        return ParsedValue(value.value, 'participant_spacing')
 
     @staticmethod
     def activate(items):
@@ -111,12 +160,7 @@ class SeqTransformer(Transformer):
 
     @staticmethod
     def DIRECTION(token):
-        direction_map = {
-            'left': MessageDirection.LEFT,
-            'right': MessageDirection.RIGHT,
-        }
-
-        value = direction_map[str(token)]
+        value = DIRECTION_MAP[token]
         return ParsedValue(value, 'direction')
 
     @staticmethod
@@ -128,10 +172,10 @@ class SeqTransformer(Transformer):
         return MessageStatement(sender, receiver, text, activation, line, arrow)
 
     @staticmethod
-    def self_call(items):
-        target = consume_next(items, 'NAME')
-        text = consume_next_opt(items, 'TEXT', default='')
-        return MessageStatement(target, target, text, MessageActivation.FIREFORGET, LineStyle.SOLID, ArrowStyle.BLOCK)
+    @v_args(inline=True)
+    def self_call(target, text):
+        return MessageStatement(target.value, target.value, text.value,
+                                MessageActivation.FIREFORGET, LineStyle.SOLID, ArrowStyle.BLOCK)
 
     @staticmethod
     def option(items):
@@ -208,74 +252,44 @@ class SeqTransformer(Transformer):
         return NoteStatement(target, text, dx, dy, width, height)
 
     @staticmethod
-    def note_dx(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'note_dx')
+    @v_args(inline=True)
+    def note_dx(value):
+        return ParsedValue(value.value, 'note_dx')
 
     @staticmethod
-    def note_dy(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'note_dy')
+    @v_args(inline=True)
+    def note_dy(value):
+        return ParsedValue(value.value, 'note_dy')
 
     @staticmethod
-    def note_width(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'note_width')
+    @v_args(inline=True)
+    def note_width(value):
+        return ParsedValue(value.value, 'note_width')
 
     @staticmethod
-    def note_height(items):
-        value = consume_next(items, 'NUMBER')
-        return ParsedValue(value, 'note_height')
+    @v_args(inline=True)
+    def note_height(value):
+        return ParsedValue(value.value, 'note_height')
 
     @staticmethod
-    def vertical_offset(items):
-        offset = consume_next(items, 'NUMBER')
-        return VerticalOffsetStatement(offset)
+    @v_args(inline=True)
+    def vertical_offset(offset):
+        return VerticalOffsetStatement(offset.value)
 
     @staticmethod
-    def extend_frame(items):
-        extend = consume_next(items, 'NUMBER')
-        return ExtendFrameStatement(extend)
+    @v_args(inline=True)
+    def extend_frame(extend):
+        return ExtendFrameStatement(extend.value)
 
     @staticmethod
-    def arrow(items):
-        line = consume_next(items, 'ARROW_LINE')
-        arrow = consume_next(items, 'ARROW_END')
-        activation = consume_next_opt(items, 'arrow_activation', MessageActivation.REGULAR)
-        return ParsedValue((line, arrow, activation), 'arrow')
-
-    @staticmethod
-    def ARROW_LINE(token):
-        line_map = {
-            '-': LineStyle.SOLID,
-            '--': LineStyle.DASHED,
-        }
-
-        return ParsedValue(line_map[str(token)], 'ARROW_LINE')
-
-    @staticmethod
-    def ARROW_END(token):
-        arrow_map = {
-            '>': ArrowStyle.BLOCK,
-            '>>': ArrowStyle.OPEN,
-        }
-
-        return ParsedValue(arrow_map[str(token)], 'ARROW_END')
-
-    @staticmethod
-    def ARROW_ACTIVATION(token):
-        activation_map = {
-            '+': MessageActivation.ACTIVATE,
-            '-': MessageActivation.DEACTIVATE,
-            '|': MessageActivation.FIREFORGET,
-        }
-
-        return ParsedValue(activation_map[str(token)], 'arrow_activation')
+    def ARROW(token):
+        return ParsedValue(ARROW_MAP[token], 'arrow')
 
     @staticmethod
     def QUOTED_TEXT(token):
-        text = str(token)[1:-1]
-        text = text.replace(r'\"', '"')
+        text = token[1:-1]
+        if r'\"' in text:
+            text = text.replace(r'\"', '"')
         return ParsedValue(text, 'QUOTED_TEXT')
 
     @staticmethod
@@ -284,17 +298,17 @@ class SeqTransformer(Transformer):
 
     @staticmethod
     def NAME(token):
-        return ParsedValue(str(token), 'NAME')
+        # names are repeated in every message, interning shares one string and speeds up the lookups by name
+        return ParsedValue(sys.intern(str(token)), 'NAME')
 
     @staticmethod
     def NUMBER(token):
         return ParsedValue(int(token), 'NUMBER')
 
 
-@dataclass
 class Statement:
-    def __init__(self):
-        self.line_number = 0
+    # set by the transformer once the statement is placed in a statement list
+    line_number: int = 0
 
 
 @dataclass
@@ -334,6 +348,36 @@ class MessageActivation(Enum):
     FIREFORGET = auto()
 
 
+DIRECTION_MAP = {
+    'left': MessageDirection.LEFT,
+    'right': MessageDirection.RIGHT,
+}
+
+LINE_STYLE_MAP = {
+    '-': LineStyle.SOLID,
+    '--': LineStyle.DASHED,
+}
+
+ARROW_STYLE_MAP = {
+    '>': ArrowStyle.BLOCK,
+    '>>': ArrowStyle.OPEN,
+}
+
+ACTIVATION_MAP = {
+    '+': MessageActivation.ACTIVATE,
+    '-': MessageActivation.DEACTIVATE,
+    '|': MessageActivation.FIREFORGET,
+}
+
+# the arrow is a single token, every combination of line, end and activation is looked up at once
+ARROW_MAP = {
+    line + end + activation: (line_style, arrow_style, message_activation)
+    for line, line_style in LINE_STYLE_MAP.items()
+    for end, arrow_style in ARROW_STYLE_MAP.items()
+    for activation, message_activation in [('', MessageActivation.REGULAR), *ACTIVATION_MAP.items()]
+}
+
+
 @dataclass
 class MessageStatement(Statement):
     sender: str
@@ -422,11 +466,11 @@ def consume_next_opt(items, expected_type, default=None):
 
 
 def consume_opt(items, expected_type, default=None):
-    for item in items:
+    for index, item in enumerate(items):
         assert isinstance(item, ParsedValue), f"unparsed value: {items[0]}"
 
         if item.type == expected_type:
-            items.remove(item)
+            del items[index]
             return item.value
 
     return default
@@ -434,11 +478,14 @@ def consume_opt(items, expected_type, default=None):
 
 def consume_all(items, expected_type):
     found = []
+    remaining = []
     for item in items:
         assert isinstance(item, ParsedValue), f"unparsed value: {items[0]}"
 
         if item.type == expected_type:
             found.append(item)
+        else:
+            remaining.append(item)
 
-    items[:] = [item for item in items if item not in found]
+    items[:] = remaining
     return [item.value for item in found]
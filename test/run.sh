@@ -20,4 +20,13 @@ for input_file in *.seq; do
   fi
 done
 
+for input_file in invalid/*.seq; do
+  echo $input_file
+
+  if $SEQGEN -o /dev/null $input_file 2> /dev/null ; then
+    echo "  NOT REJECTED!"
+    RESULT=1
+  fi
+done
+
 exit $RESULT